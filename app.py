@@ -1,16 +1,23 @@
 # app.py
+from __future__ import annotations
+
 import os
 import re
 import json
+import time
+import asyncio
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
 
-import requests
-import pandas as pd
 import streamlit as st
+from diskcache import Cache
 
-# OpenAI (official SDK)
+# httpx / OpenAI SDK(pydantic 포함)는 무거워서 실제로 호출할 때 import
 # pip install openai
-from openai import OpenAI
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI
 
 
 # -----------------------------
@@ -37,18 +44,80 @@ st.sidebar.caption("키는 브라우저 세션(session_state)에서만 사용돼
 # -----------------------------
 # Utilities / API functions
 # -----------------------------
-@st.cache_data(ttl=600, show_spinner=False)
-def get_weather(city: str, api_key: str):
+cities = [
+    "Seoul", "Busan", "Incheon", "Daegu", "Daejeon",
+    "Gwangju", "Ulsan", "Suwon", "Seongnam", "Jeju",
+]
+# 목록에 없는 도시는 OWM 404를 기다리지 않고 바로 거름
+_ALLOWED_CITIES = frozenset(cities)
+
+_BREED_RE = re.compile(r"/breeds/([^/]+)/")
+
+# 일시적 오류(레이트 리밋/서버 오류)로 보고 재시도할 상태 코드
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+# Retry-After가 이보다 길면 화면을 붙잡고 기다리지 않고 바로 포기
+_MAX_RETRY_AFTER = 5
+
+
+async def _get_with_retry(
+    client: httpx.AsyncClient, url: str, params: dict | None = None, retries: int = 3
+):
+    """
+    GET + 지수 백오프 재시도(0.3s, 0.6s, 1.2s)
+    429/5xx 응답과 연결 오류만 재시도, 마지막 시도의 결과/예외는 그대로 전달
+    Retry-After 헤더가 있으면 그 시간만큼 기다리고, 너무 길거나 해석할 수 없으면 재시도하지 않음
+    """
+    import httpx
+
+    for attempt in range(retries + 1):
+        delay = 0.3 * (2**attempt)
+        try:
+            r = await client.get(url, params=params)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if r.status_code not in _RETRY_STATUS or attempt == retries:
+                return r
+            retry_after = r.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    wait = float(retry_after)
+                except ValueError:
+                    # HTTP-date 형식은 보통 긴 대기라 바로 포기
+                    return r
+                if wait > _MAX_RETRY_AFTER:
+                    return r
+                delay = max(delay, wait)
+        await asyncio.sleep(delay)
+
+
+@st.cache_resource
+def _weather_cache() -> Cache:
+    # 서버 재시작/다른 워커 사이에도 유지되는 디스크 캐시
+    return Cache("./.cache/weather")
+
+
+async def get_weather(client: httpx.AsyncClient, city: str, api_key: str):
     """
     OpenWeatherMap 현재 날씨 (한국어, 섭씨)
-    실패 시 None 반환, timeout=10
+    (도시, 10분 구간) 단위로 디스크 캐시, 실패 시 None 반환
     """
-    if not api_key:
+    if not api_key or city not in _ALLOWED_CITIES:
         return None
+    key = (city, int(time.time() // 600))
+    try:
+        cache = _weather_cache()
+        hit = cache.get(key)
+    except Exception:
+        # 캐시 디렉터리 권한/sqlite 손상 등은 캐시 없이 바로 요청
+        cache, hit = None, None
+    if hit:
+        return hit
     try:
         url = "https://api.openweathermap.org/data/2.5/weather"
         params = {"q": city, "appid": api_key, "units": "metric", "lang": "kr"}
-        r = requests.get(url, params=params, timeout=10)
+        r = await _get_with_retry(client, url, params=params)
         if r.status_code != 200:
             return None
         data = r.json()
@@ -57,26 +126,31 @@ def get_weather(city: str, api_key: str):
         temp = main.get("temp")
         feels_like = main.get("feels_like")
         humidity = main.get("humidity")
-        return {
+        result = {
             "city": city,
             "description": weather_desc,
             "temp": temp,
             "feels_like": feels_like,
             "humidity": humidity,
         }
+        if cache is not None:
+            try:
+                cache.set(key, result, expire=600)
+            except Exception:
+                pass
+        return result
     except Exception:
         return None
 
 
-@st.cache_data(ttl=600, show_spinner=False)
-def get_dog_image():
+async def get_dog_image(client: httpx.AsyncClient):
     """
     Dog CEO 랜덤 강아지 사진 URL + 품종 추출
-    실패 시 None 반환, timeout=10
+    실패 시 None 반환
     """
     try:
         url = "https://dog.ceo/api/breeds/image/random"
-        r = requests.get(url, timeout=10)
+        r = await _get_with_retry(client, url)
         if r.status_code != 200:
             return None
         data = r.json()
@@ -88,7 +162,7 @@ def get_dog_image():
 
         # 품종 추출: .../breeds/<breed>/xxx.jpg
         breed = None
-        m = re.search(r"/breeds/([^/]+)/", img_url)
+        m = _BREED_RE.search(img_url)
         if m:
             breed = m.group(1).replace("-", " ").strip()
 
@@ -97,25 +171,63 @@ def get_dog_image():
         return None
 
 
-def _coach_system_prompt(style: str) -> str:
-    if style == "스파르타 코치":
-        return (
-            "당신은 엄격한 스파르타 코치다. 변명은 차단하고, 핵심만 찌르며, "
-            "실행 가능한 액션을 강하게 지시한다. 다만 인신공격은 금지."
-        )
-    if style == "따뜻한 멘토":
-        return (
-            "당신은 따뜻한 멘토다. 공감과 격려를 기반으로, 작은 성취를 강화하고 "
-            "현실적인 다음 कदम을 제시한다."
+async def _fetch_weather_and_dog(city: str, owm_api_key: str):
+    import httpx
+
+    # 날씨/강아지는 서로 독립적이라 동시에 요청 (총 대기 = 둘 중 느린 쪽)
+    # 두 요청은 호스트가 달라 커넥션 재사용은 같은 요청의 재시도 사이에서만 일어남
+    async with httpx.AsyncClient(timeout=10) as client:
+        return await asyncio.gather(
+            get_weather(client, city, owm_api_key),
+            get_dog_image(client),
         )
-    # 게임 마스터
-    return (
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def get_weather_and_dog(city: str, owm_api_key: str):
+    """
+    날씨 + 강아지를 병렬로 가져오는 동기 래퍼 (st.cache_data 캐시용)
+    반환: (weather | None, dog | None), timeout=10
+    """
+    weather, dog = asyncio.run(_fetch_weather_and_dog(city, owm_api_key))
+    return weather, dog
+
+
+_COACH_PROMPTS: dict[str, str] = {
+    "스파르타 코치": (
+        "당신은 엄격한 스파르타 코치다. 변명은 차단하고, 핵심만 찌르며, "
+        "실행 가능한 액션을 강하게 지시한다. 다만 인신공격은 금지."
+    ),
+    "따뜻한 멘토": (
+        "당신은 따뜻한 멘토다. 공감과 격려를 기반으로, 작은 성취를 강화하고 "
+        "현실적인 다음 단계를 제시한다."
+    ),
+    "게임 마스터": (
         "당신은 RPG 게임 마스터다. 사용자를 플레이어로 보고, 오늘의 상태를 버프/디버프로 묘사하며 "
         "퀘스트 형태로 내일 미션을 제시한다. 유쾌하고 몰입감 있게."
-    )
+    ),
+}
+
+
+def _coach_system_prompt(style: str) -> str:
+    # 알 수 없는 스타일은 게임 마스터로
+    return _COACH_PROMPTS.get(style, _COACH_PROMPTS["게임 마스터"])
+
+
+# 5개 섹션 리포트 + (low effort) 추론 토큰을 담기에 충분한 상한
+REPORT_MAX_OUTPUT_TOKENS = 1000
+
+
+@st.cache_resource(show_spinner=False, max_entries=8, ttl=3600)
+def _get_openai_client(api_key: str) -> OpenAI:
+    # 키별로 클라이언트를 재사용해 내부 httpx 커넥션 풀(keep-alive/TLS)을 유지
+    # 공유 서버라 키/풀이 무한히 쌓이지 않도록 최근 8개, 1시간까지만 보관
+    from openai import OpenAI
 
+    return OpenAI(api_key=api_key)
 
-def generate_report(
+
+def stream_report(
     openai_api_key: str,
     coach_style: str,
     date_str: str,
@@ -124,10 +236,13 @@ def generate_report(
     habits_checked: list,
     weather: dict | None,
     dog: dict | None,
+    outcome: dict,
 ):
     """
-    습관+기분+날씨+강아지 품종을 묶어 OpenAI에 전달
-    모델: gpt-5-mini
+    습관+기분+날씨+강아지 품종을 묶어 OpenAI에 전달, 생성되는 텍스트 조각을 yield
+    모델: gpt-5-mini (Responses API 스트리밍)
+    스트리밍 도중 실패하면 outcome["failed"] = True,
+    출력 상한 등으로 잘리면 outcome["incomplete"] = 사유 로 표시 (호출부에서 안내)
     출력 형식:
       - 컨디션 등급(S~D)
       - 습관 분석
@@ -136,7 +251,7 @@ def generate_report(
       - 오늘의 한마디
     """
     if not openai_api_key:
-        return None
+        return
 
     system = _coach_system_prompt(coach_style)
 
@@ -151,13 +266,12 @@ def generate_report(
     if dog:
         dog_line = f"오늘의 강아지 품종: {dog.get('breed')}"
 
+    # 날씨/강아지는 위 요약 텍스트로만 전달 (JSON에 중복으로 넣지 않음)
     user_payload = {
         "date": date_str,
         "city": city,
         "mood_1_to_10": mood,
         "completed_habits": habits_checked,
-        "weather": weather or None,
-        "dog": dog or None,
     }
 
     user_msg = f"""
@@ -180,77 +294,234 @@ def generate_report(
 - {dog_line}
 
 [원본 데이터(JSON)]
-{json.dumps(user_payload, ensure_ascii=False, indent=2)}
+{json.dumps(user_payload, ensure_ascii=False, separators=(",", ":"))}
 """.strip()
 
     try:
-        client = OpenAI(api_key=openai_api_key)
-        resp = client.responses.create(
+        client = _get_openai_client(openai_api_key)
+        with client.responses.stream(
             model="gpt-5-mini",
             instructions=system,
             input=user_msg,
+            max_output_tokens=REPORT_MAX_OUTPUT_TOKENS,
+            reasoning={"effort": "low"},
+        ) as stream:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type == "response.incomplete":
+                    # status=incomplete 는 response.completed 없이 끝나므로 이벤트에서 직접 확인
+                    details = event.response.incomplete_details
+                    outcome["incomplete"] = (details.reason if details else None) or "unknown"
+                elif event.type == "response.failed":
+                    # 서버 측 실패는 예외 없이 이벤트로만 옴
+                    error = event.response.error
+                    outcome["failed"] = True
+                    outcome["error"] = error.message if error else None
+                elif event.type == "error":
+                    outcome["failed"] = True
+                    outcome["error"] = event.message
+    except Exception:
+        # 이미 화면에 나간 부분은 되돌릴 수 없으니 실패 여부만 호출부에 알림
+        outcome["failed"] = True
+
+
+def submit_recap_batch(openai_api_key: str, coach_style: str, history: dict):
+    """
+    최근 7일 기록을 날짜별 요청으로 묶어 OpenAI Batch API에 제출
+    비실시간(최대 24시간)이지만 동기 호출보다 저렴하고 RPM 제한을 받지 않음
+    반환: batch id, 실패 시 None
+    """
+    if not openai_api_key or not history:
+        return None
+
+    system = _coach_system_prompt(coach_style)
+    lines = []
+    for date_str, row in history.items():
+        user_msg = f"""
+아래 하루 기록을 보고 주간 회고용 코멘트를 2~3문장으로 작성해줘.
+잘한 점 또는 아쉬운 점 하나와, 다음 주에 이어갈 작은 행동 하나를 포함해.
+
+{json.dumps(row, ensure_ascii=False, separators=(",", ":"))}
+""".strip()
+        lines.append(
+            json.dumps(
+                {
+                    "custom_id": date_str,
+                    "method": "POST",
+                    "url": "/v1/responses",
+                    "body": {
+                        "model": "gpt-5-mini",
+                        "instructions": system,
+                        "input": user_msg,
+                        "max_output_tokens": REPORT_MAX_OUTPUT_TOKENS,
+                        "reasoning": {"effort": "low"},
+                    },
+                },
+                ensure_ascii=False,
+            )
+        )
+
+    try:
+        client = _get_openai_client(openai_api_key)
+        batch_file = client.files.create(
+            file=("weekly_recap.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/responses",
+            completion_window="24h",
         )
-        return (resp.output_text or "").strip() or None
+        return batch.id
     except Exception:
         return None
 
 
+def _read_batch_errors(client, error_file_id: str | None):
+    """
+    배치 에러 파일에서 실패한 custom_id 목록과 첫 번째 에러 메시지를 추출
+    반환: (custom_id 리스트, 메시지 | None)
+    """
+    if not error_file_id:
+        return [], None
+    ids = []
+    message = None
+    for line in client.files.content(error_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        ids.append(item.get("custom_id"))
+        body = (item.get("response") or {}).get("body") or {}
+        err = body.get("error") or item.get("error") or {}
+        message = message or err.get("message")
+    return ids, message
+
+
+def fetch_recap_batch(openai_api_key: str, batch_id: str):
+    """
+    배치 상태 조회, 완료(또는 만료)됐으면 결과 파일을 받아 날짜별 코멘트로 변환
+    반환: (status, {날짜: 코멘트} | None, 메시지 | None)
+      - 결과가 있으면 메시지는 일부 날짜 누락 경고
+      - 결과가 없으면 메시지는 에러 (진행 중이면 None)
+    """
+    try:
+        client = _get_openai_client(openai_api_key)
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "cancelled", "expired") and not batch.output_file_id:
+            # 배치 단위 실패 사유는 batch.errors에 담김 (검증 실패 등)
+            errors = getattr(batch.errors, "data", None) or []
+            reason = errors[0].message if errors else None
+            if not reason:
+                _, reason = _read_batch_errors(client, batch.error_file_id)
+            return batch.status, None, f"배치가 {batch.status} 상태로 끝났어요. ({reason or '원인 불명'})"
+        if batch.status not in ("completed", "expired"):
+            return batch.status, None, None
+
+        # 만료된 배치도 그 전까지 끝난 요청은 output 파일에 남아 있음
+        failed_ids, reason = _read_batch_errors(client, batch.error_file_id)
+        if not batch.output_file_id:
+            return batch.status, None, f"배치의 모든 요청이 실패했어요. ({reason or '원인 불명'})"
+
+        results = {}
+        content = client.files.content(batch.output_file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            body = (item.get("response") or {}).get("body") or {}
+            # Responses API 원본 JSON: output[].content[]의 output_text 조각을 이어붙임
+            text = "".join(
+                part.get("text", "")
+                for out in body.get("output") or []
+                if out.get("type") == "message"
+                for part in out.get("content") or []
+                if part.get("type") == "output_text"
+            ).strip()
+            if text:
+                results[item.get("custom_id")] = text
+            else:
+                failed_ids.append(item.get("custom_id"))
+        if not results:
+            return batch.status, None, "배치는 끝났지만 받은 코멘트가 없어요. 다시 생성해 주세요."
+
+        warning = None
+        missing = sorted(str(i) for i in set(failed_ids) if i not in results)
+        if missing:
+            warning = f"{len(missing)}일치 코멘트를 받지 못했어요: {', '.join(missing)}"
+            if reason:
+                warning += f" ({reason})"
+        return batch.status, dict(sorted(results.items())), warning
+    except Exception:
+        return "error", None, "배치 상태를 확인하지 못했어요. 잠시 후 다시 시도해 주세요."
+
+
 # -----------------------------
 # Session state: history
 # -----------------------------
+# 세션에 보관하는 최대 일수 (오래 열어둔 탭에서도 메모리가 늘지 않도록)
+HISTORY_DAYS = 7
+
+
 def _date_str(d: datetime) -> str:
     return d.strftime("%Y-%m-%d")
 
 
-def _init_history_if_needed():
+def _init_history_if_needed(today_str: str):
     if "history" in st.session_state:
         return
 
-    # 데모용 6일 샘플 + 오늘(빈 값)
-    today = datetime.now().date()
-    sample = []
+    # 데모용 6일 샘플 + 오늘(빈 값), 날짜 문자열 -> 행 (오래된 순서로 삽입)
+    # 오늘 날짜는 호출부와 같은 값을 써야 자정 직전/직후에도 키가 7개로 맞음
+    today = datetime.strptime(today_str, "%Y-%m-%d").date()
+    sample = OrderedDict()
     # 최근 6일(오늘 제외)
     preset_rates = [40, 60, 80, 20, 100, 60]
     preset_moods = [5, 6, 7, 4, 8, 6]
     for i in range(6, 0, -1):
         d = today - timedelta(days=i)
-        sample.append(
-            {
-                "date": d.strftime("%Y-%m-%d"),
-                "rate": preset_rates[6 - i],
-                "completed": int(round(preset_rates[6 - i] / 100 * 5)),
-                "mood": preset_moods[6 - i],
-            }
-        )
+        d_str = d.strftime("%Y-%m-%d")
+        sample[d_str] = {
+            "date": d_str,
+            "rate": preset_rates[6 - i],
+            "completed": int(round(preset_rates[6 - i] / 100 * 5)),
+            "mood": preset_moods[6 - i],
+        }
 
     # 오늘 엔트리(초기값)
-    sample.append(
-        {
-            "date": today.strftime("%Y-%m-%d"),
-            "rate": 0,
-            "completed": 0,
-            "mood": 5,
-        }
-    )
+    sample[today_str] = {
+        "date": today_str,
+        "rate": 0,
+        "completed": 0,
+        "mood": 5,
+    }
 
     st.session_state.history = sample
 
 
-def _upsert_today(rate: int, completed: int, mood: int):
-    today_str = datetime.now().date().strftime("%Y-%m-%d")
-    hist = st.session_state.history
-    idx = next((i for i, r in enumerate(hist) if r["date"] == today_str), None)
-    row = {"date": today_str, "rate": int(rate), "completed": int(completed), "mood": int(mood)}
-    if idx is None:
-        hist.append(row)
-    else:
-        hist[idx] = row
-    # 최근 7일 유지
-    hist_sorted = sorted(hist, key=lambda x: x["date"])
-    st.session_state.history = hist_sorted[-7:]
+def _trim_history(hist: OrderedDict):
+    # 가장 오래된 날짜부터 제거, 빠진 행은 다른 참조가 없어 바로 해제됨
+    while len(hist) > HISTORY_DAYS:
+        hist.popitem(last=False)
 
 
-_init_history_if_needed()
+def _upsert_today(rate: int, completed: int, mood: int, today_str: str) -> bool:
+    # 반환: history를 실제로 갱신했으면 True
+    hist = st.session_state.history
+    # 값(과 날짜)이 그대로인 rerun에서는 history를 건드리지 않음
+    sig = (today_str, rate, completed, mood)
+    if st.session_state.get("_last_upsert") == sig:
+        return False
+    # 기존 날짜는 제자리 갱신, 새 날짜는 맨 뒤에 추가되어 날짜순이 유지됨
+    hist[today_str] = {
+        "date": today_str,
+        "rate": int(rate),
+        "completed": int(completed),
+        "mood": int(mood),
+    }
+    _trim_history(hist)
+    st.session_state._last_upsert = sig
+    return True
 
 
 # -----------------------------
@@ -269,60 +540,71 @@ habits = [
     ("😴", "수면"),
 ]
 
-colA, colB = st.columns(2)
-checked = []
 
-with colA:
-    c1 = st.checkbox(f"{habits[0][0]} {habits[0][1]}", value=False)
-    c2 = st.checkbox(f"{habits[1][0]} {habits[1][1]}", value=False)
-    c3 = st.checkbox(f"{habits[2][0]} {habits[2][1]}", value=False)
+@st.fragment
+def _render_checkin():
+    """
+    체크인 + 오늘의 지표 + 최근 7일 차트
+    체크박스/슬라이더를 바꾸면 이 구역만 rerun (도시/코치/리포트 영역은 그대로)
+    반환: (오늘 날짜, 완료 습관 이름 목록, 완료 개수, 달성률, 기분) - 전체 실행 때만 사용됨
+    """
+    # fragment rerun마다 날짜를 새로 계산 (탭을 밤새 열어둬도 다음 날 체크인이 새 행으로 들어감)
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    _init_history_if_needed(today_str)
 
-with colB:
-    c4 = st.checkbox(f"{habits[3][0]} {habits[3][1]}", value=False)
-    c5 = st.checkbox(f"{habits[4][0]} {habits[4][1]}", value=False)
+    colA, colB = st.columns(2)
+    checked = []
 
-flags = [c1, c2, c3, c4, c5]
-for (emoji, name), is_on in zip(habits, flags):
-    if is_on:
-        checked.append(name)
+    with colA:
+        c1 = st.checkbox(f"{habits[0][0]} {habits[0][1]}", value=False)
+        c2 = st.checkbox(f"{habits[1][0]} {habits[1][1]}", value=False)
+        c3 = st.checkbox(f"{habits[2][0]} {habits[2][1]}", value=False)
 
-mood = st.slider("🙂 오늘 기분 점수", min_value=1, max_value=10, value=7)
+    with colB:
+        c4 = st.checkbox(f"{habits[3][0]} {habits[3][1]}", value=False)
+        c5 = st.checkbox(f"{habits[4][0]} {habits[4][1]}", value=False)
 
-cities = [
-    "Seoul", "Busan", "Incheon", "Daegu", "Daejeon",
-    "Gwangju", "Ulsan", "Suwon", "Seongnam", "Jeju",
-]
-city = st.selectbox("📍 도시 선택", cities, index=0)
+    flags = [c1, c2, c3, c4, c5]
+    for (emoji, name), is_on in zip(habits, flags):
+        if is_on:
+            checked.append(name)
 
-coach_style = st.radio(
-    "🧠 코치 스타일",
-    ["스파르타 코치", "따뜻한 멘토", "게임 마스터"],
-    horizontal=True,
-)
+    mood = st.slider("🙂 오늘 기분 점수", min_value=1, max_value=10, value=7)
 
-completed_count = sum(flags)
-rate = int(round(completed_count / 5 * 100))
+    completed_count = sum(flags)
+    rate = int(round(completed_count / 5 * 100))
 
+    # -----------------------------
+    # Metrics + chart
+    # -----------------------------
+    st.subheader("📈 오늘의 지표")
 
-# -----------------------------
-# Metrics + chart
-# -----------------------------
-st.subheader("📈 오늘의 지표")
+    m1, m2, m3 = st.columns(3)
+    m1.metric("달성률", f"{rate}%")
+    m2.metric("달성 습관", f"{completed_count}/5")
+    m3.metric("기분", f"{mood}/10")
+
+    # 오늘 기록을 history에 반영(세션 유지)
+    changed = _upsert_today(
+        rate=rate, completed=completed_count, mood=mood, today_str=today_str
+    )
+    # 화면에 남은 리포트/공유 텍스트는 이전 체크인 기준이라, 값이 바뀌면 전체 rerun으로 지움
+    if changed and st.session_state.get("_report_shown"):
+        st.session_state._report_shown = False
+        st.rerun(scope="app")
+
+    st.subheader("🗓️ 최근 7일 달성률")
+    # history는 이미 날짜순 (7개뿐이라 DataFrame 없이 dict로 충분)
+    chart_data = {
+        "date": list(st.session_state.history.keys()),
+        "rate": [r["rate"] for r in st.session_state.history.values()],
+    }
+    st.bar_chart(chart_data, x="date", y="rate")
 
-m1, m2, m3 = st.columns(3)
-m1.metric("달성률", f"{rate}%")
-m2.metric("달성 습관", f"{completed_count}/5")
-m3.metric("기분", f"{mood}/10")
+    return today_str, checked, completed_count, rate, mood
 
-# 오늘 기록을 history에 반영(세션 유지)
-_upsert_today(rate=rate, completed=completed_count, mood=mood)
 
-st.subheader("🗓️ 최근 7일 달성률")
-df = pd.DataFrame(st.session_state.history)
-# 보기 좋은 순서
-df = df.sort_values("date")
-chart_df = df.set_index("date")[["rate"]]
-st.bar_chart(chart_df)
+today_str, checked, completed_count, rate, mood = _render_checkin()
 
 
 # -----------------------------
@@ -331,28 +613,28 @@ st.bar_chart(chart_df)
 st.divider()
 st.subheader("🧾 AI 코치 리포트")
 
+city = st.selectbox("📍 도시 선택", cities, index=0)
+
+coach_style = st.radio(
+    "🧠 코치 스타일",
+    ["스파르타 코치", "따뜻한 멘토", "게임 마스터"],
+    horizontal=True,
+)
+
 btn = st.button("컨디션 리포트 생성", type="primary")
 
 weather = None
 dog = None
 report = None
+# 이번 실행에서 리포트를 그렸는지 (체크인 fragment가 오래된 리포트를 지울 때 사용)
+st.session_state._report_shown = False
 
-if btn:
-    with st.spinner("날씨/강아지/리포트를 준비 중..."):
-        weather = get_weather(city, owm_key) if owm_key else None
-        dog = get_dog_image()
-
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        report = generate_report(
-            openai_api_key=openai_key,
-            coach_style=coach_style,
-            date_str=today_str,
-            city=city,
-            mood=mood,
-            habits_checked=checked,
-            weather=weather,
-            dog=dog,
-        )
+if btn and not openai_key:
+    # 키가 없으면 리포트를 만들 수 없으니 날씨/강아지 요청도 보내지 않음
+    st.error("OpenAI API Key가 필요해요. 사이드바에서 입력해 주세요.")
+elif btn:
+    with st.spinner("날씨/강아지 정보를 준비 중..."):
+        weather, dog = get_weather_and_dog(city, owm_key)
 
     # 결과 표시
     left, right = st.columns(2)
@@ -378,13 +660,34 @@ if btn:
             st.warning("강아지 이미지를 가져오지 못했어요.")
 
     st.markdown("### 🧠 AI 코치 리포트")
-    if report:
-        st.write(report)
-    else:
-        if not openai_key:
-            st.error("OpenAI API Key가 필요해요. 사이드바에서 입력해 주세요.")
+    # 토큰이 도착하는 대로 화면에 그리고, 완성된 문자열은 공유용 텍스트에 재사용
+    outcome = {}
+    report = st.write_stream(
+        stream_report(
+            openai_api_key=openai_key,
+            coach_style=coach_style,
+            date_str=today_str,
+            city=city,
+            mood=mood,
+            habits_checked=checked,
+            weather=weather,
+            dog=dog,
+            outcome=outcome,
+        )
+    )
+    report = (report or "").strip() or None
+    if not report:
+        st.error("리포트 생성에 실패했어요. 잠시 후 다시 시도해 주세요.")
+    elif outcome.get("failed"):
+        reason = f" (사유: {outcome['error']})" if outcome.get("error") else ""
+        st.error(f"리포트 생성이 도중에 중단됐어요. 위 내용은 일부만 받은 결과예요.{reason}")
+        report += "\n\n(중단됨)"
+    elif outcome.get("incomplete"):
+        if outcome["incomplete"] == "max_output_tokens":
+            st.warning("리포트가 길이 제한에 걸려 중간에 잘렸어요. 다시 생성해 보세요.")
         else:
-            st.error("리포트 생성에 실패했어요. 잠시 후 다시 시도해 주세요.")
+            st.warning(f"리포트가 끝까지 생성되지 않았어요. (사유: {outcome['incomplete']})")
+        report += "\n\n(잘림)"
 
     # 공유용 텍스트
     habit_line = ", ".join(checked) if checked else "없음"
@@ -394,7 +697,7 @@ if btn:
     dog_short = dog.get("breed") if dog else "강아지 없음"
 
     share_text = f"""[AI 습관 트래커 공유]
-- 날짜: {datetime.now().strftime("%Y-%m-%d")}
+- 날짜: {today_str}
 - 도시: {city}
 - 달성률: {rate}% ({completed_count}/5)
 - 완료 습관: {habit_line}
@@ -407,6 +710,56 @@ if btn:
 """
     st.markdown("### 📣 공유용 텍스트")
     st.code(share_text, language="text")
+    st.session_state._report_shown = True
+
+
+# -----------------------------
+# Weekly recap (Batch API)
+# -----------------------------
+st.divider()
+st.subheader("📅 주간 리캡")
+st.caption(
+    "최근 7일 기록을 Batch API로 한 번에 제출해요. 결과는 최대 24시간 뒤에 나오지만 비용이 약 절반이에요. "
+    "배치 ID는 이 탭의 세션에만 저장되니, 결과를 받기 전에 새로고침하거나 탭을 닫으면 리캡을 다시 확인할 수 없어요."
+)
+
+recap_col1, recap_col2 = st.columns(2)
+recap_submit = recap_col1.button("주간 리캡 생성")
+recap_check = recap_col2.button("리캡 상태 확인")
+
+if recap_submit:
+    if not openai_key:
+        st.error("OpenAI API Key가 필요해요. 사이드바에서 입력해 주세요.")
+    else:
+        batch_id = submit_recap_batch(openai_key, coach_style, st.session_state.history)
+        if batch_id:
+            st.session_state.recap_batch_id = batch_id
+            st.session_state.recaps = None
+            st.success(f"배치를 제출했어요. (ID: {batch_id}) 잠시 후 상태를 확인해 주세요.")
+        else:
+            st.error("배치 제출에 실패했어요. 잠시 후 다시 시도해 주세요.")
+
+if recap_check:
+    batch_id = st.session_state.get("recap_batch_id")
+    if not batch_id:
+        st.warning("먼저 주간 리캡을 생성해 주세요.")
+    elif not openai_key:
+        st.error("OpenAI API Key가 필요해요. 사이드바에서 입력해 주세요.")
+    else:
+        status, results, message = fetch_recap_batch(openai_key, batch_id)
+        if results:
+            st.session_state.recaps = results
+            if message:
+                st.warning(message)
+        elif message:
+            st.error(message)
+        else:
+            st.info(f"배치 상태: {status}")
+
+if st.session_state.get("recaps"):
+    for date_str, text in st.session_state.recaps.items():
+        st.markdown(f"**{date_str}**")
+        st.write(text)
 
 
 # -----------------------------
@@ -424,5 +777,6 @@ with st.expander("ℹ️ API 안내 / 트러블슈팅"):
 **자주 발생하는 문제**
 - 날씨가 `None`: OpenWeatherMap 키가 없거나, 호출 제한/도시명 오타/네트워크 문제일 수 있어요.
 - 리포트 실패: OpenAI 키가 없거나, 네트워크/권한 문제일 수 있어요.
+- 주간 리캡이 `in_progress`: Batch API는 비실시간 처리라 완료까지 최대 24시간 걸릴 수 있어요.
         """.strip()
     )